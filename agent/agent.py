@@ -1,31 +1,367 @@
-import json
+import asyncio
 import os
-from typing import AsyncGenerator
+import re
+from collections import Counter
+from contextlib import aclosing
+from pathlib import Path
+from typing import AsyncGenerator, Optional
 
+import orjson
 from google.adk.agents import BaseAgent, LlmAgent
 from google.adk.agents.invocation_context import InvocationContext
-from google.adk.events import Event
+from google.adk.events import Event, EventActions
+from google.adk.models import Gemini
 
+from cache import ResultCache, digest
+from pipeline import buffered, limited, merge
+from schemas import Analysis, IssueDetails, PRResult, parse_output, structured
 from tools.bash_tool import get_bash_tool
+from tools.edit_tool import EditTools
 from tools.grep_tool import GrepTools
+from tools.logger import logger
+from tools.rg_tool import RipgrepTools
+from worktree import Worktree
 
+# GitHub issue URL, capturing (owner, repo, issue_number); a query or fragment such as
+# #issuecomment-... is allowed, as in URLs copied from the GitHub UI
+_ISSUE_URL_RE = re.compile(r"https://github\.com/([^/]+)/([^/]+)/issues/(\d+)/?(?:[?#].*)?")
+
+# A completed "file" value in the analysis JSON, which may still be streaming in
+_ANALYSIS_FILE_RE = re.compile(r'"file"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+# Most files, and total characters of their contents, inlined into the implement_fix instruction;
+# files beyond that are left for the sub-agent to read itself
+_MAX_PREFETCH_FILES = 8
+_MAX_PREFETCH_CHARS = 20000
+
+# Commands the sub-agents may run through the bash tools
+_ALLOWED_CMDS = ("gh", "git", "ls", "find", "grep", "sed", "cat", "wc", "cp", "mv", "rm", "mkdir", "touch")
+
+# Error response with every field empty; error paths fill in what they know
+_ERROR_TEMPLATE = {
+    "issue_url": None,
+    "success": False,
+    "error": None,
+    "issue_details": None,
+    "analysis": None,
+    "implementation_summary": None,
+    "pull_request": None
+}
+
+# Error response that does not depend on the request, serialized once at import
+_ERR_NO_URL = orjson.dumps({**_ERROR_TEMPLATE, "error": "No issue_url provided"}).decode()
+
+# Labels marking issues that are not worth resolving
+_SKIP_LABELS = frozenset({"duplicate", "invalid"})
+
+# How often each reason short-circuited the pipeline, for operators to track the hit rate
+_skip_counts: Counter = Counter()
+
+
+def error_envelope(issue_url: Optional[str], error: str, **fields) -> str:
+    """Serialized error response for issue_url, with the fields the failing step knows filled in."""
+    return orjson.dumps({**_ERROR_TEMPLATE, "issue_url": issue_url, "error": error, **fields}).decode()
+
+
+def _skip_reason(issue: IssueDetails) -> Optional[str]:
+    """Why the issue should not be resolved, or None if the pipeline should continue."""
+    if issue.state.lower() == "closed":
+        return "closed"
+    for label in issue.labels:
+        if label.lower() in _SKIP_LABELS:
+            return label.lower()
+    return None
+
+
+class AnalysisStreamParser:
+    """Incrementally extract the files named in the analyze_issue output as it arrives."""
 
-class ResolveIssueAgent(BaseAgent):
     def __init__(self):
+        self._text = ""
+        self._scanned = 0
+        self._streamed = False
+
+    def feed_event(self, event: Event) -> list[str]:
+        """Feed a sub-agent event and return the file paths it completed."""
+        if not event.content or not event.content.parts:
+            return []
+        text = "".join(part.text for part in event.content.parts if part.text)
+        if not text:
+            return []
+        # In streaming mode partial chunks are followed by the aggregated final text
+        if event.partial:
+            self._streamed = True
+        elif self._streamed:
+            self._streamed = False
+            return []
+        return self.feed(text)
+
+    def feed(self, text: str) -> list[str]:
+        """Feed raw analysis text and return the file paths it completed."""
+        self._text += text
+        files = []
+        for match in _ANALYSIS_FILE_RE.finditer(self._text, self._scanned):
+            self._scanned = match.end()
+            try:
+                files.append(orjson.loads(f'"{match.group(1)}"'))
+            except orjson.JSONDecodeError:
+                # Not a valid JSON string, e.g. model chatter around the reply; prefetching is best effort
+                continue
+        return files
+
+
+class ResolveIssueAgent(BaseAgent):
+    def __init__(self, concurrency: int = 1):
         super().__init__(
             name="resolve_issue_agent",
             description="Agent that automates resolving GitHub issues by analyzing, implementing fixes, and creating pull requests",
         )
         
-        # Initialize tools
-        self.bash_tools = get_bash_tool(
-            allowed_commands=[
-                "gh", "git", "ls", "find", "grep", "sed", "cat", 
-                "wc", "cp", "mv", "rm", "mkdir", "touch"
-            ],
-            truncate_length=5000
-        )
+        # Initialize tools; each issue resolved at once runs one sub-agent at a time, so it gets one shell
+        self.bash_tools = get_bash_tool(allowed_commands=_ALLOWED_CMDS, truncate_length=5000, workers=concurrency)
         self.grep_tools = GrepTools()
+        self.edit_tools = EditTools()
+        self.rg_tools = RipgrepTools()
+        # Index the repository files once so every sub-agent reuses the listing
+        self.rg_tools.warm()
+
+        # Search the repository through ripgrep instead of a grep/find subprocess per call
+        if self.rg_tools.available:
+            explore_bash_tools = [tool for tool in self.bash_tools if tool.__name__ not in ("grep_cli", "find_cli")]
+            search_tools = explore_bash_tools + self.grep_tools.get_tools() + self.rg_tools.get_tools()
+        else:
+            search_tools = self.bash_tools + self.grep_tools.get_tools()
+        # Bound how many sub-agents, across all issues, hit the model at once to respect Gemini rate limits
+        self._llm_semaphore = asyncio.Semaphore(2)
+
+        # Held while a run edits files and creates its pull request branch
+        self._worktree_lock = asyncio.Lock()
+
+        # Bound how many files named in the analysis are read at once
+        self._prefetch_semaphore = asyncio.Semaphore(8)
+
+        # Issue details and analyses already computed for the same issue at the same HEAD
+        self._cache = ResultCache(
+            os.environ.get("RESOLVE_ISSUE_CACHE_DIR"), ttl=float(os.environ.get("RESOLVE_ISSUE_CACHE_TTL", 3600))
+        )
+
+        # A single model instance shares its API client across all sub-agents and requests
+        self._model = Gemini(model="gemini-2.0-flash")
+
+        # Build the sub-agents once; per-request values are injected from session state
+        self._fetch_agent = LlmAgent(
+            name="fetch_issue",
+            model=self._model,
+            instruction="""
+            Fetch a GitHub issue with: gh issue view <number> --repo <owner>/<repo> --json title,body,state,labels
+            Reply with only this JSON object:
+            {"title": "...", "description": "<issue body>", "state": "open"|"closed", "labels": ["<label name>"]}
+            If fetching fails, reply with the error message instead.
+
+            Issue: {issue_number} in {owner}/{repo}
+            """,
+            tools=self.bash_tools,
+            output_key="issue_details"
+        )
+
+        self._scan_agent = LlmAgent(
+            name="repo_scan",
+            model=self._model,
+            instruction="""
+            Index the repository in the working directory. List files with list_files (or ls and find),
+            skipping .git and dependency folders, and locate entry points, modules and main classes
+            with rg_search (or grep). Reply with one line per source file: its path and a short summary.
+            """,
+            tools=search_tools,
+            output_key="repo_index"
+        )
+
+        self._analyze_agent = LlmAgent(
+            name="analyze_issue",
+            model=self._model,
+            instruction="""
+            Find the source files (not test files) that must change to resolve the issue below.
+            Start from the repository index and read only the files you need.
+            Reply with only this JSON object, one edit per file:
+            {"edits": [{"file": "path/to/file.py", "change": "<changes needed in this file>"}]}
+
+            Issue: {issue_details}
+            Repository index: {repo_index?}
+            """,
+            tools=search_tools,
+            output_key="analysis"
+        )
+
+        self._implement_agent = LlmAgent(
+            name="implement_fix",
+            model=self._model,
+            instruction="""
+            Implement the planned edits below. Do NOT modify test files.
+            Plan every change up front and apply them with a single apply_edits call of
+            {"file", "op": "replace"|"insert"|"delete"|"create", "anchor", "payload"} edits, where anchor is
+            exact text occurring once in the file; call it again only to fix failed edits.
+            Inspect code with rg_search (or grep) and cat only; no piping, chaining or redirection.
+            Reply with a short summary of what you implemented.
+
+            Planned edits: {analysis}
+            Current file contents:
+            {analysis_files}
+            """,
+            # File edits go through apply_edits instead of one sed call per change
+            tools=[tool for tool in search_tools if tool.__name__ != "sed_cli"]
+            + self.edit_tools.get_tools()
+        )
+
+        self._pr_agent = LlmAgent(
+            name="create_pr",
+            model=self._model,
+            instruction="""
+            Open a pull request for the changes in the working tree: create a descriptively named
+            branch, commit with a clear message, push it, and run gh pr create with a clear title and body.
+            Reply with only this JSON object: {"url": "...", "branch": "...", "commit_message": "..."}
+
+            Issue: {issue_details}
+            """,
+            tools=self.bash_tools,
+            output_key="pr_output"
+        )
+
+    async def _prefetch_file(self, file_path: str) -> tuple[str, Optional[str]]:
+        """Read a file named in the analysis so implement_fix does not need a round trip for it."""
+        resolved_path = Path(file_path).resolve()
+        if self.grep_tools.working_dir not in resolved_path.parents or not resolved_path.is_file():
+            return file_path, None
+        async with self._prefetch_semaphore:
+            content = await asyncio.to_thread(self.grep_tools.read_file, file_path)
+        # read_file reports read failures in its return value rather than raising
+        if content.startswith(f"Error reading file {resolved_path}:"):
+            return file_path, None
+        return file_path, content
+
+    def _run_sub_agent(self, sub_agent: BaseAgent, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        """Run a sub-agent under the model concurrency bound, forwarding its events through a buffer."""
+        return buffered(limited(sub_agent.run_async(ctx), self._llm_semaphore))
+
+    async def _enter_worktree(self, worktree: Worktree) -> bool:
+        """Wait for the working tree and return whether it is clean enough to resolve an issue in."""
+        if not await worktree.acquire():
+            return False
+        # A batch may have moved HEAD since list_files last indexed the repository
+        await asyncio.to_thread(self.rg_tools.refresh, worktree.head)
+        return True
+
+    def _branch_ctx(self, ctx: InvocationContext, sub_agent: BaseAgent) -> InvocationContext:
+        """Child context for a sub-agent, so its tool calls and replies stay out of its siblings' prompts."""
+        branch_ctx = ctx.model_copy()
+        branch_suffix = f"{self.name}.{sub_agent.name}"
+        branch_ctx.branch = f"{ctx.branch}.{branch_suffix}" if ctx.branch else branch_suffix
+        return branch_ctx
+
+    def _state_event(self, ctx: InvocationContext, state_delta: dict) -> Event:
+        """Event that writes values into session state without running a sub-agent."""
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    def _response_event(self, ctx: InvocationContext, text: str) -> Event:
+        """Event carrying one of the orchestrator's JSON response envelopes."""
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            content={"role": "assistant", "parts": [{"text": text}]},
+        )
+
+    async def _resolve_in_worktree(
+        self, ctx: InvocationContext, issue_key: tuple, head: str, scanned: bool
+    ) -> AsyncGenerator[Event, None]:
+        """Analyze the issue, implement the fix and open a pull request; run while holding the worktree."""
+        # Look up the analysis of a previous run on the same issue and repository state
+        issue_url = ctx.session.state.get("issue_url")
+        issue_details = ctx.session.state.get("issue_details")
+        analysis_key = ("analysis", *issue_key[1:], head, digest(issue_details))
+        cached_analysis = await self._cache.get(analysis_key)
+
+        # Index the repository for the analysis, unless that already ran alongside the fetch
+        if cached_analysis is None and not scanned:
+            async for event in self._run_sub_agent(self._scan_agent, self._branch_ctx(ctx, self._scan_agent)):
+                yield event
+
+        # Step 2: Analyze the Issue
+        # Start reading each file as soon as the analysis names it
+        analysis_parser = AnalysisStreamParser()
+        prefetches = {}
+
+        def prefetch(file_paths: list[str]):
+            for file_path in file_paths:
+                if file_path and file_path not in prefetches and len(prefetches) < _MAX_PREFETCH_FILES:
+                    prefetches[file_path] = asyncio.ensure_future(self._prefetch_file(file_path))
+
+        try:
+            if cached_analysis is not None:
+                yield self._state_event(ctx, {"analysis": cached_analysis})
+                prefetch(analysis_parser.feed(cached_analysis))
+            else:
+                async for event in self._run_sub_agent(self._analyze_agent, ctx):
+                    prefetch(analysis_parser.feed_event(event))
+                    yield event
+                if parse_output(ctx.session.state.get("analysis"), Analysis) is not None:
+                    await self._cache.set(analysis_key, ctx.session.state.get("analysis"))
+            prefetched = await asyncio.gather(*prefetches.values())
+        finally:
+            for task in prefetches.values():
+                task.cancel()
+
+        # Check if analysis was completed
+        if parse_output(ctx.session.state.get("analysis"), Analysis) is None:
+            yield self._response_event(ctx, error_envelope(
+                issue_url,
+                "No analysis found",
+                issue_details=structured(ctx.session.state.get("issue_details"), IssueDetails),
+            ))
+            return
+
+        # Step 3: Implement the Fix
+        sections = []
+        budget = _MAX_PREFETCH_CHARS
+        for file_path, content in prefetched:
+            if content is None or len(content) > budget:
+                continue
+            budget -= len(content)
+            sections.append(f"--- {file_path} ---\n{content}")
+        analysis_files = "\n".join(sections)
+        yield self._state_event(ctx, {"analysis_files": analysis_files or "(none)"})
+        async for event in self._run_sub_agent(self._implement_agent, ctx):
+            yield event
+
+        # Step 4: Create Pull Request
+        async for event in self._run_sub_agent(self._pr_agent, ctx):
+            yield event
+
+        # Check if PR was created
+        if not ctx.session.state.get("pr_output"):
+            yield self._response_event(ctx, error_envelope(
+                issue_url,
+                "PR creation failed",
+                issue_details=structured(ctx.session.state.get("issue_details"), IssueDetails),
+                analysis=structured(ctx.session.state.get("analysis"), Analysis),
+                implementation_summary="Changes were implemented but PR creation failed",
+            ))
+            return
+
+        # Success response
+        success_response = {
+            "issue_url": issue_url,
+            "success": True,
+            "error": None,
+            "issue_details": structured(ctx.session.state.get("issue_details"), IssueDetails),
+            "analysis": structured(ctx.session.state.get("analysis"), Analysis),
+            "implementation_summary": "Successfully implemented code changes based on issue analysis",
+            "pull_request": structured(ctx.session.state.get("pr_output"), PRResult)
+        }
+        
+        yield self._response_event(ctx, orjson.dumps(success_response).decode())
 
     async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
         try:
@@ -35,178 +371,103 @@ class ResolveIssueAgent(BaseAgent):
             
             # Validate input
             if not issue_url:
-                error_response = {
-                    "success": False,
-                    "error": "No issue_url provided",
-                    "issue_details": None,
-                    "analysis": None,
-                    "implementation_summary": None,
-                    "pull_request": None
-                }
-                yield Event(content={"role": "assistant", "parts": [{"text": json.dumps(error_response)}]})
+                yield self._response_event(ctx, _ERR_NO_URL)
                 return
 
             # Validate issue URL format
-            if not (issue_url.startswith("https://github.com/") and "/issues/" in issue_url):
-                error_response = {
-                    "success": False,
-                    "error": "Invalid issue_url format",
-                    "issue_details": None,
-                    "analysis": None,
-                    "implementation_summary": None,
-                    "pull_request": None
-                }
-                yield Event(content={"role": "assistant", "parts": [{"text": json.dumps(error_response)}]})
+            issue_match = _ISSUE_URL_RE.fullmatch(issue_url)
+            if issue_match is None:
+                yield self._response_event(ctx, error_envelope(issue_url, "Invalid issue_url format"))
                 return
+            owner, repo, issue_number = issue_match.groups()
+            yield self._state_event(ctx, {"owner": owner, "repo": repo, "issue_number": issue_number})
 
-            # Step 1: Fetch Issue Details
-            fetch_agent = LlmAgent(
-                name="fetch_issue",
-                model="gemini-2.0-flash",
-                instruction=f"""
-                Fetch the GitHub issue details from {issue_url} using the GitHub CLI.
-                Use the gh command to get the issue details including title and description.
-                Return the issue details in JSON format with 'title' and 'description' fields.
-                If fetching fails, return an error message.
-                """,
-                tools=self.bash_tools,
-                output_key="issue_details"
-            )
-            
-            async for event in fetch_agent.run_async(ctx):
-                yield event
-
-            # Check if issue details were fetched
-            if not ctx.session.state.get("issue_details"):
-                error_response = {
-                    "success": False,
-                    "error": "No issue_details found",
-                    "issue_details": None,
-                    "analysis": None,
-                    "implementation_summary": None,
-                    "pull_request": None
-                }
-                yield Event(content={"role": "assistant", "parts": [{"text": json.dumps(error_response)}]})
-                return
+            # Look up the issue details of a previous run
+            issue_key = ("issue_details", owner, repo, issue_number)
+            cached_issue_details = await self._cache.get(issue_key)
+            if cached_issue_details is not None:
+                yield self._state_event(ctx, {"issue_details": cached_issue_details})
 
-            # Step 2: Analyze the Issue
-            analyze_agent = LlmAgent(
-                name="analyze_issue",
-                model="gemini-2.0-flash",
-                instruction="""
-                Analyze the GitHub issue to identify what needs to be fixed.
-                
-                1. Read the issue details from state['issue_details']
-                2. Explore the repository structure to understand the codebase
-                3. Identify relevant files and code sections that need modification
-                4. Output your analysis in this exact XML format:
-                
-                <analysis>
-                    <file>path/to/file.py</file>
-                    <changes_needed>Description of changes needed in this file</changes_needed>
-                </analysis>
-                
-                If multiple files need changes, use multiple <analysis> blocks.
-                Focus on the actual source code files, not test files.
-                """,
-                tools=self.bash_tools + self.grep_tools.get_tools(),
-                output_key="analysis"
-            )
-            
-            async for event in analyze_agent.run_async(ctx):
-                yield event
+            # Issues resolved concurrently share one working tree, so everything that reads
+            # or changes it runs one issue at a time, and the tree is put back afterwards
+            worktree = Worktree(self._worktree_lock)
+            scanned = False
 
-            # Check if analysis was completed
-            if not ctx.session.state.get("analysis"):
-                error_response = {
-                    "success": False,
-                    "error": "No analysis found", 
-                    "issue_details": ctx.session.state.get("issue_details"),
-                    "analysis": None,
-                    "implementation_summary": None,
-                    "pull_request": None
-                }
-                yield Event(content={"role": "assistant", "parts": [{"text": json.dumps(error_response)}]})
-                return
+            async def scan_in_worktree() -> AsyncGenerator[Event, None]:
+                nonlocal scanned
+                # Waiting for the working tree does not hold a model slot
+                if not await self._enter_worktree(worktree):
+                    return
+                # merge() already runs this stream in its own task, so it needs no buffer of its own
+                scan_events = self._scan_agent.run_async(self._branch_ctx(ctx, self._scan_agent))
+                async for event in limited(scan_events, self._llm_semaphore):
+                    yield event
+                scanned = True
 
-            # Step 3: Implement the Fix
-            implement_agent = LlmAgent(
-                name="implement_fix",
-                model="gemini-2.0-flash", 
-                instruction="""
-                Implement the code changes based on the analysis from state['analysis'].
-                
-                1. Read the analysis results to understand what changes are needed
-                2. Make the necessary code changes to the identified files
-                3. Use only the provided bash tools for file modifications
-                4. Do NOT modify test files
-                5. Verify your changes are correct
-                6. Summarize what you implemented
-                
-                Use commands like sed, grep, cat to make precise code changes.
-                Avoid piping, chaining, or redirection in bash commands.
-                """,
-                tools=self.bash_tools + self.grep_tools.get_tools()
-            )
-            
-            async for event in implement_agent.run_async(ctx):
-                yield event
+            try:
+                # Step 1: Fetch Issue Details; this does not touch the working tree, so it runs
+                # outside it while the repository scan waits for the tree and runs meanwhile
+                if cached_issue_details is None:
+                    fetch_events = limited(
+                        self._fetch_agent.run_async(self._branch_ctx(ctx, self._fetch_agent)), self._llm_semaphore
+                    )
+                    async with aclosing(merge(fetch_events, scan_in_worktree())) as events:
+                        async for event in events:
+                            yield event
+                            if event.author == self._fetch_agent.name and event.is_final_response():
+                                fetched = parse_output(ctx.session.state.get("issue_details"), IssueDetails)
+                                if fetched is None or _skip_reason(fetched) is not None:
+                                    # The issue will not be resolved, so stop the scan
+                                    break
 
-            # Step 4: Create Pull Request
-            pr_agent = LlmAgent(
-                name="create_pr",
-                model="gemini-2.0-flash",
-                instruction="""
-                Create a pull request for the implemented changes.
-                
-                1. Create a new branch with a descriptive name based on the issue
-                2. Stage and commit the changes with a clear commit message
-                3. Push the branch to the remote repository
-                4. Create a pull request using the GitHub CLI
-                5. Return the PR details including URL, branch name, and commit message
-                
-                Use git commands to manage the branch and GitHub CLI (gh) to create the PR.
-                Make sure to provide a clear PR title and description.
-                """,
-                tools=self.bash_tools,
-                output_key="pr_output"
-            )
-            
-            async for event in pr_agent.run_async(ctx):
-                yield event
+                # Check if issue details were fetched
+                issue_details = ctx.session.state.get("issue_details")
+                issue = parse_output(issue_details, IssueDetails)
+                if issue is None:
+                    yield self._response_event(ctx, error_envelope(issue_url, "No issue_details found"))
+                    return
+                if cached_issue_details is None:
+                    await self._cache.set(issue_key, issue_details)
 
-            # Check if PR was created
-            if not ctx.session.state.get("pr_output"):
-                error_response = {
-                    "success": False,
-                    "error": "PR creation failed",
-                    "issue_details": ctx.session.state.get("issue_details"),
-                    "analysis": ctx.session.state.get("analysis"), 
-                    "implementation_summary": "Changes were implemented but PR creation failed",
-                    "pull_request": None
-                }
-                yield Event(content={"role": "assistant", "parts": [{"text": json.dumps(error_response)}]})
-                return
+                # Skip the remaining steps for issues that should not be resolved
+                skip_reason = _skip_reason(issue)
+                if skip_reason is not None:
+                    _skip_counts[skip_reason] += 1
+                    logger.info(
+                        f"Skipping {owner}/{repo}#{issue_number}: {skip_reason}; skips so far: {dict(_skip_counts)}"
+                    )
+                    skipped_response = {
+                        "issue_url": issue_url,
+                        "success": True,
+                        "skipped": True,
+                        "error": None,
+                        "skip_reason": skip_reason,
+                        "issue_details": issue.model_dump(),
+                        "analysis": None,
+                        "implementation_summary": None,
+                        "pull_request": None
+                    }
+                    yield self._response_event(ctx, orjson.dumps(skipped_response).decode())
+                    return
 
-            # Success response
-            success_response = {
-                "success": True,
-                "error": None,
-                "issue_details": ctx.session.state.get("issue_details"),
-                "analysis": ctx.session.state.get("analysis"),
-                "implementation_summary": "Successfully implemented code changes based on issue analysis",
-                "pull_request": ctx.session.state.get("pr_output")
-            }
-            
-            yield Event(content={"role": "assistant", "parts": [{"text": json.dumps(success_response)}]})
+                if not await self._enter_worktree(worktree):
+                    yield self._response_event(ctx, error_envelope(
+                        issue_url,
+                        "The working tree has uncommitted changes; commit or stash them first",
+                        issue_details=issue.model_dump(),
+                    ))
+                    return
+                async for event in self._resolve_in_worktree(ctx, issue_key, worktree.head, scanned):
+                    yield event
+            finally:
+                await worktree.release(f"resolve_issue_agent changes for {issue_url}")
 
         except Exception as e:
-            error_response = {
-                "success": False,
-                "error": f"Unexpected error: {str(e)}",
-                "issue_details": ctx.session.state.get("issue_details"),
-                "analysis": ctx.session.state.get("analysis"),
-                "implementation_summary": ctx.session.state.get("implementation_summary"),
-                "pull_request": ctx.session.state.get("pr_output")
-            }
-            yield Event(content={"role": "assistant", "parts": [{"text": json.dumps(error_response)}]})
\ No newline at end of file
+            yield self._response_event(ctx, error_envelope(
+                ctx.session.state.get("issue_url"),
+                f"Unexpected error: {str(e)}",
+                issue_details=ctx.session.state.get("issue_details"),
+                analysis=ctx.session.state.get("analysis"),
+                implementation_summary=ctx.session.state.get("implementation_summary"),
+                pull_request=ctx.session.state.get("pr_output"),
+            ))
\ No newline at end of file
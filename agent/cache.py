@@ -0,0 +1,65 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, Hashable, Optional
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+from tools.logger import logger
+
+
+def digest(value: Any) -> str:
+    """Stable hash of a state value, used to key results derived from it."""
+    return hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache of sub-agent outputs keyed by (step, owner, repo, issue_number, ...); keys of results
+    that depend on the repository, such as analyses, also include the HEAD sha.
+
+    Entries live in memory for the lifetime of the process. If a directory is given and
+    diskcache is installed, entries are persisted there and survive restarts. Either way
+    they expire after ttl seconds, so issues closed or relabelled since are fetched again.
+    """
+
+    def __init__(self, directory: Optional[str] = None, ttl: float = 3600):
+        self._ttl = ttl
+        self._lock = asyncio.Lock()
+        if directory and diskcache is not None:
+            # diskcache is safe to use from several threads and does its own expiry
+            self._disk = diskcache.Cache(directory)
+        else:
+            if directory:
+                logger.warning(f"diskcache is not installed, caching in memory instead of in {directory}")
+            self._disk = None
+        # key -> (expiry time on the monotonic clock, value)
+        self._memory: dict[Hashable, tuple[float, Any]] = {}
+
+    async def get(self, key: Hashable) -> Optional[Any]:
+        if self._disk is not None:
+            # SQLite I/O runs off the event loop
+            return await asyncio.to_thread(self._disk.get, key)
+        async with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._memory[key]
+                return None
+            return value
+
+    async def set(self, key: Hashable, value: Any) -> None:
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, expire=self._ttl)
+            return
+        async with self._lock:
+            now = time.monotonic()
+            # Drop expired entries that were never read again, so a long-running process does not grow without bound
+            for expired_key in [k for k, (expires_at, _) in self._memory.items() if expires_at <= now]:
+                del self._memory[expired_key]
+            self._memory[key] = (now + self._ttl, value)
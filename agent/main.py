@@ -1,70 +1,147 @@
 import argparse
 import asyncio
-import json
 import os
+import sys
 from pathlib import Path
+from typing import Optional
 
+import orjson
+from dotenv import dotenv_values
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import InMemoryRunner
-from agent import ResolveIssueAgent
+from agent import ResolveIssueAgent, error_envelope
 
+# Stream model replies, so sub-agents emit partial events that run ahead of the consumer
+_RUN_CONFIG = RunConfig(streaming_mode=StreamingMode.SSE)
 
-async def main():
-    parser = argparse.ArgumentParser(description="Resolve GitHub Issue Agent")
-    parser.add_argument("--issue-url", required=True, help="GitHub issue URL to resolve")
-    parser.add_argument("--user-id", default="user123", help="User ID for session")
-    parser.add_argument("--app-name", default="resolve_issue_app", help="Application name")
-    
-    args = parser.parse_args()
-    
-    # Load environment variables from .env file if it exists
-    env_file = Path(__file__).parent.parent / ".env"
-    if env_file.exists():
-        with open(env_file) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#") and "=" in line:
-                    key, value = line.split("=", 1)
-                    os.environ[key] = value
-    
-    # Initialize the agent and runner
-    agent = ResolveIssueAgent()
-    runner = InMemoryRunner(app_name=args.app_name, agent=agent)
-    
+# Parsed .env contents, kept so re-entrant calls to main() skip reading the file again
+_dotenv: Optional[dict[str, str]] = None
+
+
+def load_env(env_file: Path):
+    """Export the variables from env_file into os.environ, overriding existing values."""
+    global _dotenv
+    if _dotenv is None:
+        values = dotenv_values(env_file) if env_file.exists() else {}
+        _dotenv = {key: value for key, value in values.items() if value is not None}
+    os.environ.update(_dotenv)
+
+
+def positive_int(value: str) -> int:
+    """argparse type for options that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def write_text(text: str, pretty: bool):
+    """Write a response to stdout, re-indenting JSON when pretty is set."""
+    if pretty:
+        try:
+            # Try to parse as JSON for pretty printing
+            text = orjson.dumps(orjson.loads(text), option=orjson.OPT_INDENT_2).decode()
+        except orjson.JSONDecodeError:
+            # If not JSON, print as-is
+            pass
+    sys.stdout.write(text)
+    sys.stdout.write("\n")
+
+
+async def resolve_issue(runner: InMemoryRunner, args: argparse.Namespace, issue_url: str, pretty: bool):
+    """Run the agent on one issue in its own session and write its responses."""
     # Create session with initial state
     session = await runner.session_service.create_session(
         app_name=args.app_name,
         user_id=args.user_id,
         state={
-            "issue_url": args.issue_url,
-            "user_input": f"Please resolve the GitHub issue: {args.issue_url}"
+            "issue_url": issue_url,
+            "user_input": f"Please resolve the GitHub issue: {issue_url}"
         }
     )
     
-    # Run the agent
-    print(f"Resolving GitHub issue: {args.issue_url}")
-    print("Processing...")
+    # Run the agent; progress goes to stderr so stdout only carries responses
+    print(f"Resolving GitHub issue: {issue_url}", file=sys.stderr)
+    print("Processing...", file=sys.stderr)
     
     async for event in runner.run_async(
         user_id=args.user_id,
         session_id=session.id,
         new_message={
             "role": "user", 
-            "parts": [{"text": f"Please resolve the GitHub issue: {args.issue_url}"}]
-        }
+            "parts": [{"text": f"Please resolve the GitHub issue: {issue_url}"}]
+        },
+        run_config=_RUN_CONFIG,
     ):
-        # Print final response
-        if hasattr(event, 'content') and event.content:
-            if isinstance(event.content, dict) and 'parts' in event.content:
-                for part in event.content['parts']:
-                    if 'text' in part:
-                        try:
-                            # Try to parse as JSON for pretty printing
-                            response = json.loads(part['text'])
-                            print(json.dumps(response, indent=2))
-                        except json.JSONDecodeError:
-                            # If not JSON, print as-is
-                            print(part['text'])
+        # Print the orchestrator's responses, not the sub-agents' intermediate replies
+        if event.author != runner.agent.name:
+            continue
+        try:
+            parts = event.content.parts
+        except AttributeError:
+            # Events without content, such as state-only updates
+            continue
+        for part in parts or ():
+            if part.text is not None:
+                write_text(part.text, pretty)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Resolve GitHub Issue Agent")
+    issues = parser.add_mutually_exclusive_group(required=True)
+    issues.add_argument("--issue-url", help="GitHub issue URL to resolve")
+    issues.add_argument("--issue-urls-file", type=Path, help="File with one GitHub issue URL per line to resolve")
+    parser.add_argument("--concurrency", type=positive_int, default=4, help="Number of issues resolved at once")
+    parser.add_argument("--user-id", default="user123", help="User ID for session")
+    parser.add_argument("--app-name", default="resolve_issue_app", help="Application name")
+    
+    args = parser.parse_args()
+    
+    # Load environment variables from .env file if it exists
+    load_env(Path(__file__).parent.parent / ".env")
+
+    if args.issue_urls_file:
+        try:
+            text = args.issue_urls_file.read_text()
+        except OSError as e:
+            parser.error(f"cannot read --issue-urls-file: {e}")
+        lines = (line.strip() for line in text.splitlines())
+        # Resolving an issue twice at once could open two pull requests for it
+        issue_urls = list(dict.fromkeys(line for line in lines if line))
+        if not issue_urls:
+            parser.error(f"--issue-urls-file {args.issue_urls_file} contains no issue URLs")
+    else:
+        issue_urls = [args.issue_url]
+    
+    # Initialize the agent and runner, shared by every issue
+    agent = ResolveIssueAgent(concurrency=min(args.concurrency, len(issue_urls)))
+    runner = InMemoryRunner(app_name=args.app_name, agent=agent)
+
+    # Write each response as soon as it arrives; only pretty-print for a terminal
+    sys.stdout.reconfigure(write_through=True)
+    pretty = sys.stdout.isatty()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_one(issue_url: str):
+        async with semaphore:
+            try:
+                await resolve_issue(runner, args, issue_url, pretty)
+            except Exception as e:
+                # Report the failure and let the rest of the batch carry on
+                print(f"Failed to resolve {issue_url}: {e}", file=sys.stderr)
+                write_text(error_envelope(issue_url, f"Unexpected error: {str(e)}"), pretty)
+
+    await asyncio.gather(*(run_one(issue_url) for issue_url in issue_urls))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,80 @@
+import asyncio
+from typing import AsyncGenerator
+
+from google.adk.events import Event
+
+_SENTINEL = object()
+
+
+async def _produce(
+    events: AsyncGenerator[Event, None],
+    queue: asyncio.Queue,
+    slots: asyncio.Semaphore,
+):
+    async for event in events:
+        await slots.acquire()
+        # Complete events carry history and state deltas that the runner has to commit
+        # before the sub-agent reads the session again, so only partial chunks run ahead
+        committed = None if event.partial else asyncio.Event()
+        queue.put_nowait((event, committed))
+        if committed is not None:
+            await committed.wait()
+
+
+async def _drain(
+    streams: tuple[AsyncGenerator[Event, None], ...],
+    maxsize: int,
+) -> AsyncGenerator[Event, None]:
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(maxsize)
+    tasks = [asyncio.ensure_future(_produce(events, queue, slots)) for events in streams]
+    gathered = asyncio.gather(*tasks)
+
+    def finish(future: asyncio.Future):
+        # Mark the exception as retrieved; it is re-raised below unless the consumer stopped early
+        if not future.cancelled():
+            future.exception()
+        queue.put_nowait(_SENTINEL)
+
+    gathered.add_done_callback(finish)
+    try:
+        while (item := await queue.get()) is not _SENTINEL:
+            event, committed = item
+            slots.release()
+            yield event
+            if committed is not None:
+                committed.set()
+        # Surface any exception raised by one of the producers
+        await gathered
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def buffered(events: AsyncGenerator[Event, None], maxsize: int = 16) -> AsyncGenerator[Event, None]:
+    """
+    Forward events from a sub-agent through a queue filled by a background task.
+
+    The sub-agent keeps producing streamed chunks while the consumer is still handling
+    earlier ones, with at most maxsize events held in the queue. Only partial events run
+    ahead, so this has no effect unless the run streams (RunConfig streaming_mode SSE).
+    Closing the returned generator cancels the background task.
+    """
+    return _drain((events,), maxsize)
+
+
+def merge(*streams: AsyncGenerator[Event, None], maxsize: int = 16) -> AsyncGenerator[Event, None]:
+    """
+    Drive several independent sub-agent event streams concurrently and forward their events.
+
+    Events of each stream keep their relative order. Closing the returned generator, e.g.
+    with contextlib.aclosing after breaking out early, cancels the streams still running.
+    """
+    return _drain(streams, maxsize)
+
+
+async def limited(events: AsyncGenerator[Event, None], limit: asyncio.Semaphore) -> AsyncGenerator[Event, None]:
+    """Forward a sub-agent's events while holding limit, so it counts against it for as long as it runs."""
+    async with limit:
+        async for event in events:
+            yield event
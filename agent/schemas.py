@@ -0,0 +1,46 @@
+from typing import Optional, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class IssueDetails(BaseModel):
+    title: str
+    description: str
+    state: str = "open"
+    labels: list[str] = []
+
+
+class FileEdit(BaseModel):
+    file: str
+    change: str
+
+
+class Analysis(BaseModel):
+    edits: list[FileEdit]
+
+
+class PRResult(BaseModel):
+    url: str
+    branch: str
+    commit_message: str
+
+
+def parse_output(text: Optional[str], model: type[T]) -> Optional[T]:
+    """Parse a sub-agent's JSON reply into model, tolerating a surrounding markdown code fence."""
+    if not text:
+        return None
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        return model.model_validate_json(text[start:end + 1])
+    except ValidationError:
+        return None
+
+
+def structured(text: Optional[str], model: type[BaseModel]):
+    """The sub-agent's reply as a JSON-serializable dict if it matches model, else the raw text."""
+    parsed = parse_output(text, model)
+    return parsed.model_dump() if parsed is not None else text
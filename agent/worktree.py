@@ -0,0 +1,88 @@
+import asyncio
+import subprocess
+
+from tools.logger import logger
+
+
+async def _git(*args: str) -> tuple[int, str]:
+    """Run a git command in the working directory and return its (returncode, stdout)."""
+    process = await asyncio.create_subprocess_exec(
+        "git",
+        *args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    stdout, _ = await process.communicate()
+    return process.returncode, stdout.decode("utf-8").strip()
+
+
+async def git_head() -> str:
+    """Return the HEAD commit sha of the working directory, or an empty string outside a git repo."""
+    returncode, sha = await _git("rev-parse", "HEAD")
+    return sha if returncode == 0 else ""
+
+
+async def current_ref() -> str:
+    """Return the checked out branch, or the HEAD commit sha if HEAD is detached."""
+    returncode, branch = await _git("symbolic-ref", "--short", "-q", "HEAD")
+    return branch if returncode == 0 else await git_head()
+
+
+async def restore_worktree(start_ref: str, label: str) -> None:
+    """
+    Put the working tree back on start_ref with no local changes.
+
+    Changes a run left behind, e.g. because its push failed, are stashed under label
+    rather than discarded, so the next run does not commit them into its own pull request.
+    Only call this for a tree that was clean when the run started, see Worktree.
+    """
+    _, status = await _git("status", "--porcelain")
+    if status:
+        returncode, _ = await _git("stash", "push", "--include-untracked", "-m", label)
+        if returncode == 0:
+            logger.warning(f"Stashed changes left in the working tree as {label!r}")
+        else:
+            logger.error(f"Could not stash changes left in the working tree by {label!r}")
+    if start_ref and await current_ref() != start_ref:
+        returncode, _ = await _git("checkout", start_ref)
+        if returncode != 0:
+            logger.error(f"Could not check out {start_ref} again after {label!r}")
+
+
+class Worktree:
+    """
+    One run's exclusive use of the shared working tree.
+
+    acquire() waits for the lock and records the tree's state; release() puts the tree back
+    the way it was and lets the next run in. A tree that already had changes when acquired is
+    left alone, so a user's uncommitted work is neither resolved into a pull request nor stashed.
+    """
+
+    def __init__(self, lock: asyncio.Lock):
+        self._lock = lock
+        self.acquired = False
+        self.clean = False
+        self.start_ref = ""
+        self.head = ""
+
+    async def acquire(self) -> bool:
+        """Wait for the working tree and return whether it was clean; later calls return at once."""
+        if not self.acquired:
+            await self._lock.acquire()
+            self.acquired = True
+            _, status = await _git("status", "--porcelain")
+            self.start_ref = await current_ref()
+            self.head = await git_head()
+            self.clean = not status
+        return self.clean
+
+    async def release(self, label: str) -> None:
+        """Undo what the run left in the working tree, if it started clean, and release the lock."""
+        if not self.acquired:
+            return
+        try:
+            if self.clean:
+                await restore_worktree(self.start_ref, label)
+        finally:
+            self.acquired = False
+            self._lock.release()
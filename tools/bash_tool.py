@@ -1,15 +1,163 @@
 import asyncio
+import shlex
+import shutil
 import subprocess
+import uuid
 from textwrap import indent
-from typing import Awaitable, Callable, List, Optional, Any, Coroutine
+from typing import Awaitable, Callable, Optional, Any, Coroutine, Sequence
 
 from patched_adk.config import truncate_str
 
 from .logger import logger
 
+BASH_PATH = shutil.which("bash") or "/bin/bash"
 
-def create_runtime_cli_tool(command: str, truncate_length: Optional[int] ):
+# Exit status of a command killed by SIGPIPE, as reported by bash
+SIGPIPE_RETURNCODE = 128 + 13
+
+# Commands that only read, so stopping them once enough output has arrived loses nothing
+READ_ONLY_COMMANDS = frozenset({"cat", "grep", "ls", "wc"})
+
+# Read-only subcommands of commands that can also change things, matched on the leading arguments
+READ_ONLY_SUBCOMMANDS = {
+    "gh": (("issue", "view"),),
+    "git": (("log",), ("show",), ("diff",), ("status",)),
+}
+
+
+def is_read_only(command: str, args: Sequence[str]) -> bool:
+    """Whether the command only reads, so it may be stopped partway once its output is long enough."""
+    if command in READ_ONLY_COMMANDS:
+        return True
+    return any(tuple(args[:len(subcommand)]) == subcommand for subcommand in READ_ONLY_SUBCOMMANDS.get(command, ()))
+
+
+class BashWorker:
+    """
+    A persistent bash process that runs tool commands one at a time.
+
+    Commands are written to the shell's stdin followed by a marker line on stdout and
+    stderr, so each tool call costs a pipe write instead of a fork and exec of its own.
+    """
+
+    def __init__(self):
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = asyncio.Lock()
+
+    async def _ensure_started(self) -> asyncio.subprocess.Process:
+        loop = asyncio.get_running_loop()
+        if self._process is None or self._process.returncode is not None or self._loop is not loop:
+            # On the stdlib event loop, an absolute executable path and close_fds=False let CPython
+            # spawn the shell with posix_spawn instead of fork+exec and a scan closing every fd.
+            # uvloop, which main.py uses when installed, spawns through libuv instead, so this only
+            # helps without it. Python's own fds are non-inheritable (PEP 446), so the shell still
+            # only inherits the pipes.
+            self._process = await asyncio.create_subprocess_exec(
+                BASH_PATH,
+                "--noprofile",
+                "--norc",
+                "-s",
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                close_fds=False,
+            )
+            self._loop = loop
+        return self._process
+
+    def _reset(self):
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+        self._process = None
+
+    @staticmethod
+    async def _read_until_marker(stream: asyncio.StreamReader, marker: bytes) -> tuple[bytes, bytes]:
+        """Read up to the marker line, returning the output before it and the rest of that line."""
+        buffer = bytearray()
+        separator = b"\n" + marker
+        while True:
+            index = buffer.find(separator)
+            if index != -1:
+                end = buffer.find(b"\n", index + len(separator))
+                if end != -1:
+                    return bytes(buffer[:index]), bytes(buffer[index + len(separator):end])
+            chunk = await stream.read(65536)
+            if not chunk:
+                raise RuntimeError("bash worker exited unexpectedly")
+            buffer += chunk
+
+    async def run(self, command: str, args: list[str], max_bytes: Optional[int] = None) -> tuple[int, bytes, bytes]:
+        """
+        Run a command with the given arguments and return its (returncode, stdout, stderr).
+
+        If max_bytes is given and the command only reads (see is_read_only), stdout is cut off by
+        the shell after max_bytes + 1 bytes and the command is stopped, so output that would be
+        truncated anyway never reaches the pipe. Getting more than max_bytes back means the output
+        was cut off. Any other command runs to completion, since stopping it partway could leave
+        its changes half done.
+        """
+        if not is_read_only(command, args):
+            max_bytes = None
+        async with self._lock:
+            process = await self._ensure_started()
+            marker = f"__END_{uuid.uuid4().hex}__"
+            # Arguments are quoted so the shell runs exactly one command, without expansion,
+            # and stdin is closed so interactive prompts cannot read the worker's input
+            command_line = f"{shlex.join([command, *args])} </dev/null"
+            if max_bytes:
+                command_line += f" | head -c {max_bytes + 1}\n__rc=${{PIPESTATUS[0]}}\n"
+            else:
+                command_line += "\n__rc=$?\n"
+            script = (
+                command_line
+                + f"printf '\\n%s%d\\n' {marker} $__rc\n"
+                + f"printf '\\n%s\\n' {marker} >&2\n"
+            )
+            try:
+                process.stdin.write(script.encode("utf-8"))
+                await process.stdin.drain()
+                (stdout, returncode), (stderr, _) = await asyncio.gather(
+                    self._read_until_marker(process.stdout, marker.encode("utf-8")),
+                    self._read_until_marker(process.stderr, marker.encode("utf-8")),
+                )
+            except BaseException:
+                # The shell may be mid-command, so its output can no longer be trusted
+                self._reset()
+                raise
+            returncode = int(returncode)
+            if max_bytes and returncode == SIGPIPE_RETURNCODE and len(stdout) > max_bytes:
+                # The command was stopped by head closing the pipe, which is expected
+                returncode = 0
+            return returncode, stdout, stderr
+
+
+class BashWorkerPool:
+    """
+    A fixed number of BashWorkers shared by the command tools.
+
+    Each call is handed an idle worker, so a slow command such as git push only holds up
+    its own shell. Workers start their shell on first use and are reused most recent first.
+    """
+
+    def __init__(self, size: int = 1):
+        self._idle = [BashWorker() for _ in range(size)]
+        self._available = asyncio.Semaphore(size)
+
+    async def run(self, command: str, args: list[str], max_bytes: Optional[int] = None) -> tuple[int, bytes, bytes]:
+        """Run a command on an idle worker; see BashWorker.run."""
+        async with self._available:
+            worker = self._idle.pop()
+            try:
+                return await worker.run(command, args, max_bytes)
+            finally:
+                self._idle.append(worker)
+
+
+def create_runtime_cli_tool(command: str, truncate_length: Optional[int], pool: BashWorkerPool):
     func_name = f"{command}_cli"
+    # Read up to 4 bytes per character so the truncated text is never short of UTF-8 input
+    max_bytes = truncate_length * 4 if truncate_length else None
     func_docstring = f"""
 \"\"\"
 Run a {command}.
@@ -26,31 +174,27 @@ Returns:
 async def {func_name}(args: list[str]) -> str:
 {indent(func_docstring, '    ')}
     logger.info(f"bash_tool called with command: {command} {{args}}")
-    process = await asyncio.create_subprocess_exec(
-        '{command}',
-        *args,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    if process.returncode != 0:
+    returncode, stdout, stderr = await pool.run('{command}', args, {max_bytes})
+    if returncode != 0:
         err_msg = stderr.decode("utf-8")
-        err_str = f"Command {command} {{args}} failed with return code {{process.returncode}} and stderr: {{err_msg}}"
+        err_str = f"Command {command} {{args}} failed with return code {{returncode}} and stderr: {{err_msg}}"
         logger.error(err_str)
         return f"Error: {{err_str}}"
-    output = stdout.decode("utf-8")
-    if {truncate_length} and len(output) > {truncate_length}:
+    output = stdout.decode("utf-8", errors="replace")
+    # More than max_bytes means the shell cut the output off, even if it decodes to few characters
+    if {truncate_length} and (len(output) > {truncate_length} or len(stdout) > {max_bytes}):
         output = output[:{truncate_length}] + truncate_str
     logger.info(f"bash_tool output: {{output}}")
     return output
     """
     code = compile(func_text, "<string>", "exec")
     space = dict()
-    exec(code, globals(), space)
-    print(space)
+    exec(code, {**globals(), "pool": pool}, space)
     return space[func_name]
 
 def get_bash_tool(
-    allowed_commands: Optional[List[str]] = None, truncate_length: Optional[int] = None
+    allowed_commands: Optional[Sequence[str]] = None, truncate_length: Optional[int] = None, workers: int = 1
 ) -> list[Callable[[list[str]], Awaitable[str]]]:
-    return [create_runtime_cli_tool(command, truncate_length) for command in allowed_commands]
+    # All command tools share one pool of shell processes
+    pool = BashWorkerPool(workers)
+    return [create_runtime_cli_tool(command, truncate_length, pool) for command in allowed_commands]
@@ -0,0 +1,111 @@
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from .logger import logger
+
+EDIT_OPS = ("replace", "insert", "delete", "create")
+
+
+class EditTools:
+    def __init__(self, working_dir: Optional[Path] = None):
+        if working_dir is None:
+            working_dir = Path.cwd()
+        self.working_dir = working_dir
+
+    def _apply_to_content(self, content: str, edits: list[dict]) -> str:
+        for edit in edits:
+            op = edit.get("op")
+            anchor = edit.get("anchor") or ""
+            payload = edit.get("payload") or ""
+            if op not in EDIT_OPS:
+                raise ValueError(f"unsupported op {op!r}, expected one of {', '.join(EDIT_OPS)}")
+            if op == "create":
+                if content:
+                    raise ValueError("create needs a new or empty file, use replace or insert instead")
+                content = payload
+                continue
+            count = content.count(anchor) if anchor else 0
+            if count != 1:
+                raise ValueError(f"anchor must match exactly once, found {count} matches for {anchor!r}")
+            if op == "replace":
+                content = content.replace(anchor, payload, 1)
+            elif op == "insert":
+                content = content.replace(anchor, anchor + payload, 1)
+            else:
+                content = content.replace(anchor, "", 1)
+        return content
+
+    def apply_edits(self, edits: list[dict]) -> str:
+        """
+        Applies a batch of text edits to files, reading and writing each file only once.
+
+        Args:
+            edits: The list of edits to apply, in order. Each edit is an object with:
+                file: The path to the file to edit, relative to the working directory.
+                op: One of 'replace' (replace anchor with payload), 'insert' (insert payload
+                    right after anchor), 'delete' (remove anchor) or 'create' (write payload as
+                    the content of a new or empty file).
+                anchor: The exact text to locate in the file. It must occur exactly once.
+                    Ignored for 'create'.
+                payload: The text to write for 'replace', 'insert' and 'create'. Ignored for 'delete'.
+
+        Returns:
+            A summary with one line per file, saying whether its edits were applied.
+            Edits to a file are all-or-nothing: if any of them fails, the file is left unchanged.
+        """
+        logger.info(f"apply_edits called with {len(edits)} edits")
+
+        if not edits:
+            err = "Error: No edits provided"
+            logger.error(err)
+            return err
+
+        edits_by_file: dict[str, list[dict]] = {}
+        for edit in edits:
+            edits_by_file.setdefault(edit.get("file", ""), []).append(edit)
+
+        results = []
+        for path, file_edits in edits_by_file.items():
+            resolved_path = Path(path).resolve()
+
+            if self.working_dir not in resolved_path.parents:
+                err = f"Error: {resolved_path} is not inside {self.working_dir}. Please provide a relative path, or a path inside {self.working_dir}."
+                logger.error(err)
+                results.append(err)
+                continue
+
+            creating = not resolved_path.exists() and file_edits[0].get("op") == "create"
+            if not creating and not resolved_path.is_file():
+                err = f"Error: {resolved_path} is not a file"
+                logger.error(err)
+                results.append(err)
+                continue
+
+            try:
+                # newline="" keeps the file's line endings, so a CRLF file is not rewritten to LF
+                if creating:
+                    content = ""
+                else:
+                    with open(resolved_path, "r", encoding="utf-8", newline="") as f:
+                        content = f.read()
+                content = self._apply_to_content(content, file_edits)
+                if creating:
+                    resolved_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(resolved_path, "w", encoding="utf-8", newline="") as f:
+                    f.write(content)
+            except Exception as e:
+                err = f"Error: edits to {path} were not applied: {e}"
+                logger.error(err)
+                results.append(err)
+                continue
+
+            results.append(f"Applied {len(file_edits)} edits to {path}")
+
+        return_val = "\n".join(results)
+        logger.debug(f"apply_edits output: {return_val}")
+        return return_val
+
+    def get_tools(self) -> List[Callable]:
+        return [
+            self.apply_edits,
+        ]
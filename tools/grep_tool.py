@@ -88,6 +88,7 @@ class GrepTools:
         if working_dir is None:
             working_dir = Path.cwd()
         self.working_dir = working_dir
+        self._tools: Optional[List[Callable]] = None
 
     def find_files(
         self, path: str, unix_pattern: str, depth: int = 1, is_case_sensitive: bool = False, **kwargs
@@ -366,8 +367,11 @@ class GrepTools:
             return err
 
     def get_tools(self) -> List[Callable]:
-        return [
-            self.find_files,
-            self.find_text_in_files,
-            self.read_file,
-        ]
\ No newline at end of file
+        # Built once so every agent shares the same bound methods and list
+        if self._tools is None:
+            self._tools = [
+                self.find_files,
+                self.find_text_in_files,
+                self.read_file,
+            ]
+        return self._tools
\ No newline at end of file
@@ -0,0 +1,216 @@
+import asyncio
+import fnmatch
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import orjson
+from patched_adk.config import find_text_char_limit
+
+from .logger import logger
+
+# Stop reading ripgrep output after this many matches or listed files
+MAX_RESULTS = 200
+
+# Longest ripgrep --json record read, in bytes; --max-columns does not shorten these records
+MAX_RECORD_BYTES = 1 << 20
+
+
+class RipgrepTools:
+    def __init__(self, working_dir: Optional[Path] = None):
+        if working_dir is None:
+            working_dir = Path.cwd()
+        self.working_dir = working_dir
+        self.rg_path = shutil.which("rg")
+        self._files: Optional[List[str]] = None
+        # HEAD commit the file index was built at
+        self._index_head: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        return self.rg_path is not None
+
+    def warm(self) -> None:
+        """Build the file index once so list_files calls do not walk the repository again."""
+        if not self.available:
+            logger.warning("rg not found on PATH, ripgrep tools are disabled")
+            return
+        head = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=self.working_dir,
+            capture_output=True,
+            text=True,
+        )
+        self._index_head = head.stdout.strip() if head.returncode == 0 else ""
+        result = subprocess.run(
+            [self.rg_path, "--files", "--sort", "path"],
+            cwd=self.working_dir,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode not in (0, 1):
+            logger.error(f"rg --files failed with return code {result.returncode} and stderr: {result.stderr}")
+            return
+        self._files = result.stdout.splitlines()
+        logger.info(f"rg file index built with {len(self._files)} files")
+
+    def refresh(self, head: str) -> None:
+        """Rebuild the file index if HEAD is no longer the commit it was built at."""
+        if self._files is None or head != self._index_head:
+            self.warm()
+
+    def list_files(self, unix_pattern: str = "*") -> str:
+        """
+        Lists the files in the repository, skipping anything ignored by .gitignore and hidden files.
+
+        Args:
+            unix_pattern: The Unix shell style pattern to match file paths against,
+                relative to the working directory (e.g., '*.py', 'src/*', '*test*'). Default lists all files.
+
+        Returns:
+            A newline separated list of matching file paths, relative to the working directory.
+        """
+        logger.info(f"list_files called with pattern {unix_pattern}")
+
+        if self._files is None:
+            self.warm()
+        if self._files is None:
+            err = "Error: file index is unavailable"
+            logger.error(err)
+            return err
+
+        matches = [path for path in self._files if fnmatch.fnmatch(path, unix_pattern)]
+        if not matches:
+            err = "Error: No files found."
+            logger.error(err)
+            return err
+
+        return_val = "\n".join(matches[:MAX_RESULTS])
+        if len(matches) > MAX_RESULTS:
+            return_val += f"\n<TRUNCATED: {len(matches) - MAX_RESULTS} more files>"
+        logger.debug(f"list_files output: {return_val}")
+        return return_val
+
+    async def rg_search(
+        self, pattern: str, path: str = ".", globs: Optional[list[str]] = None, is_case_sensitive: bool = False
+    ) -> str:
+        """
+        Searches file contents for a regular expression using ripgrep, skipping files ignored by .gitignore.
+
+        Args:
+            pattern: The regular expression to search for (Rust regex syntax, e.g. 'def \\w+_tool', 'class Team\\b').
+            path: The file or directory to search in, relative to the working directory. Default is the whole repository.
+            globs: Optional list of glob patterns to include or, prefixed with '!', exclude (e.g., ['*.py', '!tests/*']).
+            is_case_sensitive: Whether the pattern should be case-sensitive (default: False).
+
+        Returns:
+            A string containing the matching lines, each prefixed with the file path and line number.
+        """
+        logger.info(
+            f"rg_search called with pattern {pattern}, path {path}, globs {globs}, is_case_sensitive {is_case_sensitive}"
+        )
+
+        if not self.available:
+            err = "Error: rg is not installed"
+            logger.error(err)
+            return err
+
+        resolved_path = Path(path).resolve()
+
+        if self.working_dir not in resolved_path.parents and self.working_dir != resolved_path:
+            err = f"Error: {resolved_path} is not a subdirectory of {self.working_dir}. Please provide a relative path, or a subdirectory of {self.working_dir}."
+            logger.error(err)
+            return err
+
+        args = ["--json", "--max-columns", str(find_text_char_limit)]
+        if not is_case_sensitive:
+            args.append("--ignore-case")
+        for glob in globs or []:
+            args.extend(["--glob", glob])
+        args.extend(["-e", pattern, "--", str(resolved_path)])
+
+        # rg_path is absolute, so with close_fds=False CPython can use posix_spawn on the stdlib
+        # event loop; under uvloop libuv spawns the process either way
+        process = await asyncio.create_subprocess_exec(
+            self.rg_path,
+            *args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            close_fds=False,
+            limit=MAX_RECORD_BYTES,
+        )
+
+        # Drain stderr alongside stdout, so a flood of error messages cannot fill its pipe and block rg
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+
+        # Parse matches as ripgrep emits them and stop reading once there are enough
+        matches = []
+        truncated = False
+        try:
+            while line := await self._read_record(process.stdout):
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # The rest of a record that was too long to read
+                    continue
+                if record["type"] != "match":
+                    continue
+                if len(matches) == MAX_RESULTS:
+                    truncated = True
+                    break
+                data = record["data"]
+                file_path = os.path.relpath(data["path"].get("text", ""), self.working_dir)
+                line_text = data["lines"].get("text", "<binary>").rstrip("\n")
+                matches.append(f"{file_path}:{data['line_number']}: {line_text}")
+
+            if truncated:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+            stderr = await stderr_task
+            await process.wait()
+        finally:
+            stderr_task.cancel()
+            # Do not leave rg running if parsing failed or the call was cancelled
+            if process.returncode is None:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+                await process.wait()
+
+        if not matches and process.returncode == 2:
+            err = f"Error: rg failed with stderr: {stderr.decode('utf-8')}"
+            logger.error(err)
+            return err
+
+        if not matches:
+            err = "Error: No matches found."
+            logger.error(err)
+            return err
+
+        return_val = "\n".join(matches)
+        if truncated:
+            return_val += f"\n<TRUNCATED: more than {MAX_RESULTS} matches, narrow the pattern or path>"
+        logger.debug(f"rg_search output: {return_val}")
+        return return_val
+
+    @staticmethod
+    async def _read_record(stream: asyncio.StreamReader) -> bytes:
+        """Read one --json record, skipping records longer than MAX_RECORD_BYTES."""
+        while True:
+            try:
+                return await stream.readline()
+            except ValueError:
+                # A match in a minified file or a long data line; the part already
+                # buffered is dropped and any remainder fails to parse as JSON
+                logger.warning(f"Skipping rg record longer than {MAX_RECORD_BYTES} bytes")
+
+    def get_tools(self) -> List[Callable]:
+        return [
+            self.list_files,
+            self.rg_search,
+        ]